@@ -1,10 +1,16 @@
-import base64
-import json
+import io
 import logging
+import mmap
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any
 
+import orjson
+import xxhash
 from openai import OpenAI, APIConnectionError as OpenAIAPIError, APIStatusError
+from PIL import Image
 
 from . import config, exceptions
 
@@ -16,11 +22,26 @@ class AIService:
         if not config.OPENAI_API_KEY:
             raise exceptions.ZettelkastenError("OPENAI_API_KEY not found in environment.")
         self._client = OpenAI(api_key=config.OPENAI_API_KEY)
+        # Bounds the number of in-flight OpenAI requests to stay under rate limits.
+        self._api_semaphore = threading.Semaphore(config.MAX_CONCURRENCY)
+        # Persistent map of image content hash -> OpenAI file ID, so each
+        # unique image is uploaded at most once across all runs and retries.
+        self._file_id_lock = threading.Lock()
+        try:
+            with open(config.FILE_ID_CACHE_PATH, 'rb') as f:
+                self._file_ids = orjson.loads(f.read())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            self._file_ids = {}
 
     def transcribe_notes(self, annotations: Dict[str, Any]) -> Dict[str, Any]:
         """
         Iterates through annotations, transcribes notes using a configured prompt,
         and returns the updated data.
+
+        Notes are independent of each other, so they are grouped into batches
+        of TRANSCRIPTION_BATCH_SIZE images per API call and the batches are
+        dispatched concurrently through a thread pool; wall time is roughly
+        ceil(N / (MAX_CONCURRENCY * batch size)) round-trips instead of N.
         """
         notes_to_process = [
             (loc, item)
@@ -28,59 +49,160 @@ class AIService:
             for item in items
             if item.get('type') == 'note' and 'transcription' not in item
         ]
-        
+
         total_notes = len(notes_to_process)
         logging.info(f"Found {total_notes} notes to transcribe.")
 
-        for i, (loc, item) in enumerate(notes_to_process, 1):
-            logging.info(f"Transcribing note {i}/{total_notes} for Loc {loc}...")
-            image_path = item['image_path']
+        if not notes_to_process:
+            return annotations
+
+        batch_size = config.TRANSCRIPTION_BATCH_SIZE
+        batches = [
+            notes_to_process[start:start + batch_size]
+            for start in range(0, total_notes, batch_size)
+        ]
+
+        transcribed = 0
+        with ThreadPoolExecutor(max_workers=config.MAX_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(self._transcribe_batch, batch): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                future.result()
+                transcribed += len(futures[future])
+                logging.info(f"Transcribed {transcribed}/{total_notes} notes.")
+
+        return annotations
+
+    def prefetch_transcription(self, image_path: str):
+        """
+        Transcribes a single note image ahead of time to warm the result
+        cache; used to overlap PDF parsing with the network-bound API calls.
+        Failures are logged and left for the main transcription pass to retry.
+        """
+        try:
+            self._transcribe_batch([("prefetch", {"type": "note", "image_path": image_path})])
+        except Exception as e:
+            logging.warning(f"Prefetch transcription failed for {image_path}: {e}")
 
+    def _transcribe_batch(self, batch):
+        """
+        Transcribes a batch of note images with a single API call, mutating the
+        items in place. Safe to run from worker threads: each call touches only
+        its own items.
+
+        The transcription prompt must return a JSON array with one
+        transcription object per input image, aligned with input order.
+        """
+        pending = []
+        for loc, item in batch:
+            image_path = item['image_path']
             if not os.path.exists(image_path):
                 logging.warning(f"Image not found for Loc {loc}: {image_path}. Skipping.")
                 item['transcription'] = {"error": "Image file not found."}
                 continue
-            
-            base64_image = self._encode_image(image_path)
-            
-            for attempt in range(config.MAX_RETRIES):
-                try:
+
+            cache_key = self._image_cache_key(image_path)
+            cache_path = os.path.join(config.TRANSCRIPTION_CACHE_DIR, f"{cache_key}.json")
+            if os.path.exists(cache_path):
+                # Kindle repeats identical note images, and reruns re-process
+                # the same files; a cached transcription skips the API call.
+                with open(cache_path, 'rb') as f:
+                    item['transcription'] = orjson.loads(f.read())
+                continue
+
+            pending.append((loc, item, cache_path, cache_key))
+
+        if not pending:
+            return
+
+        locs = ", ".join(loc for loc, _, _, _ in pending)
+
+        for attempt in range(config.MAX_RETRIES):
+            try:
+                # Uploads happen inside the retry loop so a transient failure
+                # while pushing an image is retried and, after the last
+                # attempt, recorded per-note like any other API error instead
+                # of aborting the whole run. Completed uploads land in the
+                # file-ID map, so a retry re-sends nothing.
+                content = [
+                    {"type": "input_image",
+                     "file_id": self._get_or_upload_file_id(item['image_path'], cache_key)}
+                    for _, item, _, cache_key in pending
+                ]
+                with self._api_semaphore:
                     response = self._client.responses.create(
                         prompt={"id": config.TRANSCRIPTION_PROMPT_ID},
-                        input=[{
-                            "role": "user",
-                            "content": [{
-                                "type": "input_image",
-                                "image_url": f"data:image/jpeg;base64,{base64_image}",
-                            }],
-                        }]
+                        input=[{"role": "user", "content": content}]
                     )
-                    
-                    response_content = response.output[0].content[0].text
-                    transcription_data = json.loads(response_content)
+
+                response_content = response.output[0].content[0].text
+                transcriptions = orjson.loads(response_content)
+                if not isinstance(transcriptions, list) or len(transcriptions) != len(pending):
+                    raise exceptions.JSONParsingError(
+                        f"Expected a JSON array of {len(pending)} transcriptions, "
+                        f"got {type(transcriptions).__name__}."
+                    )
+
+                # Shape-check every entry while still inside the retry loop:
+                # a response that parses as JSON but lacks the expected fields
+                # should trigger a retry, not surface downstream.
+                for transcription_data in transcriptions:
+                    if not (isinstance(transcription_data, dict)
+                            and isinstance(transcription_data.get('type'), str)
+                            and isinstance(transcription_data.get('transcription'), str)):
+                        raise exceptions.JSONParsingError(
+                            f"Transcription entry has unexpected shape: {transcription_data!r}"
+                        )
+
+                os.makedirs(config.TRANSCRIPTION_CACHE_DIR, exist_ok=True)
+                for (loc, item, cache_path, _), transcription_data in zip(pending, transcriptions):
                     item['transcription'] = transcription_data
-                    logging.info(f"  -> Successfully transcribed note for Loc {loc}.")
-                    break  # Success
-                except (OpenAIAPIError, APIStatusError, json.JSONDecodeError) as e:
-                    logging.warning(f"  -> Attempt {attempt + 1}/{config.MAX_RETRIES} failed: {e}")
-                    if attempt + 1 == config.MAX_RETRIES:
-                        logging.error(f"Failed to transcribe note for Loc {loc} after {config.MAX_RETRIES} attempts.")
+                    tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(orjson.dumps(transcription_data))
+                    os.replace(tmp_path, cache_path)
+                break  # Success
+            except (OpenAIAPIError, APIStatusError, orjson.JSONDecodeError,
+                    exceptions.JSONParsingError) as e:
+                logging.warning(f"  -> Attempt {attempt + 1}/{config.MAX_RETRIES} failed for Loc(s) {locs}: {e}")
+                if attempt + 1 == config.MAX_RETRIES:
+                    logging.error(f"Failed to transcribe notes for Loc(s) {locs} after {config.MAX_RETRIES} attempts.")
+                    for loc, item, _, _ in pending:
                         item['transcription'] = {"error": f"Failed after multiple retries. Last error: {e}"}
-        
-        return annotations
+                else:
+                    # Exponential backoff: immediate retries tend to re-hit the
+                    # same rate limit or transient failure.
+                    time.sleep(2 ** attempt)
 
-    def organize_ideas(self, transcribed_annotations: Dict[str, Any]) -> Dict[str, Any]:
+    def organize_ideas(self, transcribed_annotations: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
         """
         Sends transcribed annotations to a configured prompt to identify and link core ideas.
+
+        Responses are cached on disk keyed by a hash of the payload, so
+        re-running the organize step on unchanged transcriptions (common while
+        debugging templates) costs no API call. Pass use_cache=False to force
+        a fresh request.
         """
         logging.info("Organizing ideas using pre-configured AI prompt...")
-        
+
+        payload = orjson.dumps(transcribed_annotations).decode()
+        cache_path = os.path.join(
+            config.ORGANIZE_CACHE_DIR, f"{xxhash.xxh3_128_hexdigest(payload)}.json"
+        )
+
+        if use_cache and os.path.exists(cache_path):
+            logging.info("Using cached organizer response (pass --no-cache to bypass).")
+            with open(cache_path, 'rb') as f:
+                return orjson.loads(f.read())
+
         try:
             response = self._client.responses.create(
                 prompt={
                     "id": config.ORGANIZATION_PROMPT_ID,
                     "variables": {
-                        "transcribed_annotations": json.dumps(transcribed_annotations)
+                        "transcribed_annotations": payload
                     }
                 }
             )
@@ -96,15 +218,80 @@ class AIService:
                 raise exceptions.ZettelkastenError("No content found in API response.")
             
             response_text = content_item.content[0].text
-            organized_data = json.loads(response_text)
+            organized_data = orjson.loads(response_text)
             logging.info("Successfully organized ideas.")
+
+            os.makedirs(config.ORGANIZE_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(organized_data))
+            os.replace(tmp_path, cache_path)
+
             return organized_data
         except (OpenAIAPIError, APIStatusError) as e:
             raise exceptions.APIConnectionError(f"Failed to connect to OpenAI API: {e}")
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             raise exceptions.JSONParsingError(f"Failed to parse AI response as JSON: {e}")
 
-    def _encode_image(self, image_path: str) -> str:
-        """Encodes an image file to a base64 string."""
+    @staticmethod
+    def _image_cache_key(image_path: str) -> str:
+        """
+        Cache key for an image: xxh3 of the original bytes plus the downscale
+        settings, so tuning size or quality invalidates stale entries.
+        """
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
\ No newline at end of file
+            # The file is memory-mapped rather than read into an intermediate
+            # bytes object; xxh3 accepts buffer objects directly.
+            with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                image_hash = xxhash.xxh3_128_hexdigest(mm)
+        return f"{image_hash}_{config.MAX_IMAGE_DIMENSION}_q{config.JPEG_QUALITY}"
+
+    def _get_or_upload_file_id(self, image_path: str, cache_key: str) -> str:
+        """
+        Returns an OpenAI file ID for an image, uploading the downscaled JPEG
+        only when no previous run has uploaded identical content.
+
+        Base64 data URLs inflated every image 4/3x on every request and every
+        retry. With the Files API each unique image crosses the wire once;
+        the content-hash -> file ID map is persisted, so retries and re-runs
+        of the transcription step send only the prompt and an ID.
+        """
+        with self._file_id_lock:
+            file_id = self._file_ids.get(cache_key)
+        if file_id:
+            return file_id
+
+        try:
+            payload = (f"{cache_key}.jpg", io.BytesIO(self._downscale_to_jpeg(image_path)))
+        except Exception as e:
+            # The extractor deliberately keeps images PIL cannot decode (the
+            # perceptual-hash dedup skips them too), so upload the original
+            # bytes and let the API accept or reject them rather than crashing
+            # the transcription run.
+            logging.warning(f"Could not downscale '{image_path}' ({e}). Uploading original bytes.")
+            with open(image_path, 'rb') as f:
+                payload = (os.path.basename(image_path), io.BytesIO(f.read()))
+
+        upload = self._client.files.create(file=payload, purpose='vision')
+
+        with self._file_id_lock:
+            self._file_ids[cache_key] = upload.id
+            tmp_path = f"{config.FILE_ID_CACHE_PATH}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(self._file_ids))
+            os.replace(tmp_path, config.FILE_ID_CACHE_PATH)
+
+        return upload.id
+
+    @staticmethod
+    def _downscale_to_jpeg(image_path: str) -> bytes:
+        """
+        Loads an image, bounds it to MAX_IMAGE_DIMENSION on the long edge, and
+        re-encodes it as JPEG at the configured quality.
+        """
+        with Image.open(image_path) as img:
+            img = img.convert('RGB')
+            img.thumbnail((config.MAX_IMAGE_DIMENSION, config.MAX_IMAGE_DIMENSION), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=config.JPEG_QUALITY, optimize=True)
+            return buffer.getvalue()
\ No newline at end of file
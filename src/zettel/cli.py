@@ -34,6 +34,11 @@ def main():
         default='all',
         help="Run a specific step of the process. 'all' runs the full pipeline."
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the cached AI organizer response and re-query the API."
+    )
 
     args = parser.parse_args()
 
@@ -41,7 +46,7 @@ def main():
         processor = ZettelkastenProcessor(args.pdf_path, document_title=args.title)
 
         if args.step == 'all':
-            processor.run_full_process()
+            processor.run_full_process(use_cache=not args.no_cache)
         elif args.step == 'parse':
             processor.run_parser()
             logging.info("✅ Parsing step completed.")
@@ -49,7 +54,7 @@ def main():
             processor.run_transcriber()
             logging.info("✅ Transcription step completed.")
         elif args.step == 'organize':
-            processor.run_organizer()
+            processor.run_organizer(use_cache=not args.no_cache)
             logging.info("✅ Organization step completed.")
         elif args.step == 'generate':
             processor.run_note_generator()
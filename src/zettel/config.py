@@ -7,6 +7,22 @@ load_dotenv()
 # --- API Configuration ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MAX_RETRIES = 3
+MAX_CONCURRENCY = 8  # Max simultaneous OpenAI requests during transcription.
+# Note images sent per transcription request. The transcription prompt must
+# return a JSON array with one transcription per image, in input order.
+TRANSCRIPTION_BATCH_SIZE = 4
+# Images are downscaled to this bound on the long edge and re-encoded as JPEG
+# before upload; the vision model samples nothing beyond this resolution.
+MAX_IMAGE_DIMENSION = 1568
+JPEG_QUALITY = 85
+
+# --- Parsing ---
+# Max Hamming distance between perceptual hashes for two note images to be
+# considered visually identical (and deduplicated).
+PHASH_DISTANCE_THRESHOLD = 8
+# Documents with fewer pages than this are extracted in-process; process-pool
+# startup costs more than it saves on small PDFs.
+PARALLEL_PAGE_THRESHOLD = 16
 # Note: Model, temp, and tokens are now controlled by your prompt configuration in OpenAI
 # so we can remove them from here.
 
@@ -19,6 +35,10 @@ STRUCTURED_JSON_PATH = os.path.join(OUTPUT_DIR, "1_structured_annotations.json")
 TRANSCRIBED_JSON_PATH = os.path.join(OUTPUT_DIR, "2_transcribed_annotations.json")
 ORGANIZED_JSON_PATH = os.path.join(OUTPUT_DIR, "3_organized_ideas.json")
 LITERATURE_NOTE_PATH = os.path.join(OUTPUT_DIR, "literature_note.md")
+ORGANIZE_CACHE_DIR = os.path.join(OUTPUT_DIR, ".organize_cache")
+TRANSCRIPTION_CACHE_DIR = os.path.join(OUTPUT_DIR, ".transcription_cache")
+FILE_ID_CACHE_PATH = os.path.join(OUTPUT_DIR, ".file_id_cache.json")
+JINJA_CACHE_DIR = os.path.join(OUTPUT_DIR, ".jinja_cache")
 PERMANENT_NOTE_DIR = os.path.join(OUTPUT_DIR, "permanent_notes")
 
 # --- Prompts ---
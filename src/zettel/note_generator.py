@@ -1,13 +1,20 @@
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Any
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 from . import config, exceptions
 
+def _write_note(path_and_content):
+    """Writes one rendered note to disk; used by the write thread pool."""
+    path, content = path_and_content
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
 class NoteGenerator:
     """
     Generates markdown notes from structured data using Jinja2 templates.
@@ -15,7 +22,16 @@ class NoteGenerator:
     def __init__(self, template_dir: str):
         if not os.path.isdir(template_dir):
             raise exceptions.FileNotFoundError(f"Template directory not found: {template_dir}")
-        self._env = Environment(loader=FileSystemLoader(template_dir))
+        # The bytecode cache persists compiled templates across processes, so
+        # repeated CLI runs skip the parse/compile step entirely.
+        os.makedirs(config.JINJA_CACHE_DIR, exist_ok=True)
+        self._env = Environment(
+            loader=FileSystemLoader(template_dir),
+            bytecode_cache=FileSystemBytecodeCache(directory=config.JINJA_CACHE_DIR),
+        )
+        # Load both templates once up front and reuse the compiled objects.
+        self._literature_template = self._env.get_template('literature_template.md')
+        self._permanent_template = self._env.get_template('permanent_template.md')
 
     def create_literature_note(self, transcribed_data: Dict[str, Any], output_path: str):
         """
@@ -23,15 +39,21 @@ class NoteGenerator:
         """
         logging.info("Generating literature note...")
         try:
-            template = self._env.get_template('literature_template.md')
-            
+            template = self._literature_template
+
+            # Single pass with one type lookup per item; the old comprehension
+            # re-fetched 'type' and allocated a fallback dict for every note.
             filtered_data = {}
             for loc, items in transcribed_data.items():
-                filtered_items = [
-                    item for item in items
-                    if item.get('type') == 'highlight' or
-                    (item.get('type') == 'note' and item.get('transcription', {}).get('type') == 'summary')
-                ]
+                filtered_items = []
+                for item in items:
+                    item_type = item.get('type')
+                    if item_type == 'highlight':
+                        filtered_items.append(item)
+                    elif item_type == 'note':
+                        transcription = item.get('transcription')
+                        if isinstance(transcription, dict) and transcription.get('type') == 'summary':
+                            filtered_items.append(item)
                 if filtered_items:
                     filtered_data[loc] = filtered_items
 
@@ -59,7 +81,7 @@ class NoteGenerator:
             os.makedirs(output_dir, exist_ok=True)
             
             try:
-                template = self._env.get_template('permanent_template.md')
+                template = self._permanent_template
                 ideas = organized_data.get('ideas', [])
                 
                 if not ideas:
@@ -67,6 +89,7 @@ class NoteGenerator:
                     return
 
                 notes_generated_count = 0
+                rendered_notes = []
                 for i, idea in enumerate(ideas):
                     idea_loc = str(idea.get('idea_location'))
                     idea_idx = int(idea.get('idea_index'))
@@ -105,11 +128,14 @@ class NoteGenerator:
                     )
 
                     filename = f"idea_{i + 1:03d}.md"
-                    filepath = os.path.join(output_dir, filename)
+                    rendered_notes.append((os.path.join(output_dir, filename), markdown_output))
+
+                # Rendering stays in this thread (Jinja environments share
+                # mutable state), but the per-file writes are independent
+                # syscalls that overlap cleanly in a thread pool.
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    list(executor.map(_write_note, rendered_notes))
 
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        f.write(markdown_output)
-                
                 logging.info(f"{notes_generated_count} permanent notes generated in '{output_dir}'.")
             
             except Exception as e:
@@ -1,7 +1,9 @@
-import json
 import logging
 import os
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any
+
+import orjson
 
 from . import config
 from .pdf_parser import PDFParser
@@ -14,24 +16,40 @@ class ZettelkastenProcessor:
     """
     def __init__(self, pdf_path: str, document_title: str = None):
         self._pdf_path = pdf_path
-        self._parser = PDFParser(pdf_path, config.PDF_IMAGE_DIR)
         self._ai_service = AIService()
         self._note_generator = NoteGenerator(config.TEMPLATE_DIR)
-        self._document_title = document_title if document_title else self._parser.get_title()
+        if document_title:
+            self._document_title = document_title
+        else:
+            with PDFParser(pdf_path, config.PDF_IMAGE_DIR) as parser:
+                self._document_title = parser.get_title()
         os.makedirs(config.OUTPUT_DIR, exist_ok=True)
 
-    def run_full_process(self):
+    def run_full_process(self, use_cache: bool = True):
         """Runs the complete workflow from parsing to note generation."""
         logging.info("Starting full Zettelkasten process...")
-        structured_data = self.run_parser()
+        # Parsing is CPU/disk-bound and transcription is network-bound, so the
+        # two stages are overlapped: each note image is submitted for
+        # transcription the moment its bytes hit disk, warming the result
+        # cache while later pages are still being parsed. The transcription
+        # stage below then runs largely against the cache.
+        with ThreadPoolExecutor(max_workers=config.MAX_CONCURRENCY) as prefetch_pool:
+            structured_data = self.run_parser(
+                on_image=lambda path: prefetch_pool.submit(
+                    self._ai_service.prefetch_transcription, path
+                )
+            )
         transcribed_data = self.run_transcriber(structured_data)
-        organized_data = self.run_organizer(transcribed_data)
+        organized_data = self.run_organizer(transcribed_data, use_cache=use_cache)
         self.run_note_generator(organized_data, transcribed_data, self._document_title)
         logging.info("✅ Full process completed successfully!")
 
-    def run_parser(self) -> Dict[str, Any]:
+    def run_parser(self, on_image: Callable[[str], None] = None) -> Dict[str, Any]:
         """Runs only the PDF parsing stage."""
-        data = self._parser.parse()
+        # The parser is opened per run so the native document buffers are
+        # released as soon as parsing finishes, not at interpreter teardown.
+        with PDFParser(self._pdf_path, config.PDF_IMAGE_DIR) as parser:
+            data = parser.parse(on_image=on_image)
         self._save_json(data, config.STRUCTURED_JSON_PATH)
         return data
 
@@ -44,12 +62,12 @@ class ZettelkastenProcessor:
         self._save_json(transcribed_data, config.TRANSCRIBED_JSON_PATH)
         return transcribed_data
 
-    def run_organizer(self, data: Dict[str, Any] = None) -> Dict[str, Any]:
+    def run_organizer(self, data: Dict[str, Any] = None, use_cache: bool = True) -> Dict[str, Any]:
         """Runs only the idea organization stage."""
         if data is None:
             data = self._load_json(config.TRANSCRIBED_JSON_PATH)
-            
-        organized_data = self._ai_service.organize_ideas(data)
+
+        organized_data = self._ai_service.organize_ideas(data, use_cache=use_cache)
         self._save_json(organized_data, config.ORGANIZED_JSON_PATH)
         return organized_data
         
@@ -72,15 +90,15 @@ class ZettelkastenProcessor:
     def _save_json(self, data: Dict, path: str):
         """Saves a dictionary to a JSON file."""
         logging.info(f"Saving data to '{path}'...")
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
 
     def _load_json(self, path: str) -> Dict[str, Any]:
         """Loads data from a JSON file."""
         logging.info(f"Loading data from '{path}'...")
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(path, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             logging.error(f"Could not load data. File not found: {path}")
             raise
\ No newline at end of file